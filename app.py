@@ -1,9 +1,38 @@
 import pandas as pd
 import numpy as np
 import streamlit as st
-import requests
+import aiohttp
+import asyncio
+import atexit
+import csv
+import json
+import logging
+import os
+import shutil
+import threading
 import time
-from ta.volatility import AverageTrueRange
+from collections import namedtuple
+
+try:
+    from numba import njit
+except ImportError:  # Plain Python fallback: same code, just not compiled
+    def njit(*args, **kwargs):
+        return lambda f: f
+    HAS_NUMBA = False
+else:
+    HAS_NUMBA = True
+
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+try:
+    import talib
+    HAS_TALIB = True
+except ImportError:
+    HAS_TALIB = False
 
 # === CONFIG ===
 REFRESH_MIN = 15
@@ -12,9 +41,35 @@ BTC_TF = "4h"
 ATR_LEN = 96
 BODY_FCTR = 0.3
 VOL_MULT = 2.5
+MIN_QUOTE_VOLUME = 1_000_000  # 24h quote volume, valued in USDT, below which a pair is not screened
+TOP_N_BY_VOLUME = 150  # Screen only the N most traded liquid pairs; None screens them all
+MAX_CONCURRENCY = 20  # In-flight klines requests; keeps us under Binance's request-weight limit
+WEIGHT_PER_MIN = 1200  # Request-weight budget per minute (Binance allows more; leave headroom)
+BINANCE_WEIGHT_LIMIT = 6000  # Binance's own per-IP request-weight limit per minute
+KLINES_WEIGHT = 2
+TICKER_24HR_WEIGHT = 80  # All-symbols /ticker/24hr
+MAX_BACKOFF = 60  # Longer Retry-After means an IP ban; give up instead of waiting
+RSI_LEN = 14
+RSI_OVERSOLD = 30
+WINDOW = ATR_LEN + 2  # Bars per pair fed to the scan kernel
+STATE_LABELS = np.array(["", "🔥 WARM-DIP", "⚠️ NEAR-DIP", "🚨 FULL PRE-DIP"])  # Indexed by score
+INTERVAL_MS = {"m": 60_000, "h": 3_600_000, "d": 86_400_000}
+KLINE_STREAM = True  # Keep pair windows live over a websocket instead of re-polling REST
+MAX_STREAMS = 1000  # Binance allows 1024 streams per websocket connection
+MAX_RECONNECT_DELAY = 300  # Reconnect backoff doubles from 5s up to this many seconds
+CACHE_DIR = ".cache/klines"  # On-disk klines cache, survives app restarts
+TICKERS_CSV = None  # Set to "Tickers.csv" to screen that list instead of the test symbols
+
+# The kline feed runs outside any script run, so it reports through logging
+logger = logging.getLogger(__name__)
+
+# Parsed klines as plain NumPy columns; ts stays in epoch milliseconds
+Bars = namedtuple("Bars", ["ts", "o", "h", "l", "c", "v"])
 
 SPOT_BASE = "https://api.binance.com/api/v3"  # Main Binance API
 # SPOT_BASE = "https://api.binance.us/api/v3"  # Uncomment for U.S. users if needed
+WS_BASE = "wss://stream.binance.com:9443"
+# WS_BASE = "wss://stream.binance.us:9443"  # Uncomment for U.S. users if needed
 
 # Proxy configuration (replace with your proxy details)
 PROXIES = {
@@ -36,151 +91,573 @@ st.set_page_config(
 # Button to clear cache
 if st.button("Clear Cache"):
     st.cache_data.clear()
+    st.session_state.pop("klines_cache", None)
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
     st.write("Cache cleared!")
 
+def read_tickers(path):
+    # Single-column file: the csv module is enough, no DataFrame needed
+    with open(path, newline="") as f:
+        return [row[0].strip() for row in csv.reader(f) if row and row[0].strip()]
+
 @st.cache_data(ttl=REFRESH_MIN * 60)
 def load_symbols():
     try:
-        # Hardcoded symbols for testing
-        symbols = ["BTCUSDT", "ETHUSDT", "ADAUSDT", "BNBUSDT", "XRPUSDT"]
-        # Uncomment to use Tickers.csv
-        # df = pd.read_csv("Tickers.csv", header=None, names=["symbol"])
-        # symbols = df.symbol.astype(str).tolist()
+        if TICKERS_CSV:
+            symbols = read_tickers(TICKERS_CSV)
+        else:
+            # Hardcoded symbols for testing
+            symbols = ["BTCUSDT", "ETHUSDT", "ADAUSDT", "BNBUSDT", "XRPUSDT"]
         st.write(f"Loaded {len(symbols)} symbols")
         return symbols
     except Exception as e:
         st.error(f"Error loading symbols: {e}")
         return []
 
-def fetch_ohlcv(symbol, interval, limit=ATR_LEN + 2, retries=3):
-    url = f"{SPOT_BASE}/klines?symbol={symbol}&interval={interval}&limit={limit}"
+async def make_session():
+    # Every klines request reuses the same kept-alive TLS connections instead
+    # of paying a fresh handshake per symbol.
+    connector = aiohttp.TCPConnector(limit=100, limit_per_host=50, keepalive_timeout=75, ttl_dns_cache=300)
+    return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=10))
+
+@st.cache_resource
+def get_http():
+    # aiohttp sessions are bound to the loop that created them, so the loop is
+    # cached alongside the session and driven from the script thread. The lock
+    # keeps concurrent browser sessions from running it at the same time.
+    loop = asyncio.new_event_loop()
+    session = loop.run_until_complete(make_session())
+    atexit.register(lambda: loop.run_until_complete(session.close()))
+    return loop, session, threading.Lock()
+
+def run_http(coro_fn, *args):
+    loop, session, lock = get_http()
+    with lock:
+        try:
+            return loop.run_until_complete(coro_fn(session, *args))
+        finally:
+            # Drop stragglers left behind if the run was interrupted by a rerun
+            pending = asyncio.all_tasks(loop)
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+
+def next_candle_close(interval):
+    # Epoch ms at which the current candle of `interval` closes
+    tf_ms = int(interval[:-1]) * INTERVAL_MS[interval[-1]]
+    now_ms = int(time.time() * 1000)
+    return (now_ms // tf_ms + 1) * tf_ms
+
+def cache_expiry(interval):
+    # Klines end with the still-forming candle, whose close and volume move
+    # until it closes: keep them no longer than that close or one refresh.
+    return min(next_candle_close(interval), next_candle_close(f"{REFRESH_MIN}m"))
+
+class TokenBucket:
+    """Request-weight budget refilled continuously at `rate` per `per` seconds."""
+
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+        self.updated = now
+
+    async def take(self, weight):
+        async with self.lock:
+            self.refill()
+            while self.tokens < weight:
+                await asyncio.sleep((weight - self.tokens) * self.per / self.rate)
+                self.refill()
+            self.tokens -= weight
+
+    def sync(self, used, limit):
+        # Binance reports the whole IP's weight used this minute against its own
+        # `limit`: scale what is left of it into our budget. Other clients on a
+        # shared IP can use more than our budget, so floor at empty rather than
+        # going into debt; a take() then waits at most weight * per / rate.
+        self.refill()
+        self.tokens = max(0.0, min(self.tokens, self.rate * (1 - used / limit)))
+
+@st.cache_resource
+def weight_budget():
+    # One budget for the whole app: Binance limits per IP, not per session
+    return TokenBucket(WEIGHT_PER_MIN, 60)
+
+class FileCache:
+    """Bars stored as .npy files, each with a .meta sidecar of {timestamp, ttl}.
+
+    Shared by every session and kept across restarts, so a redeploy inside a
+    candle does not refetch the whole universe. Arrays are saved with NumPy
+    rather than pickled: the app runs as __main__, so pickled Bars would not
+    load back.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, "_".join(map(str, key)))
+
+    def get(self, key):
+        # (expiry in epoch ms, bars), or None when missing or expired
+        path = self.path(key)
+        try:
+            with open(path + ".meta") as f:
+                meta = json.load(f)
+            expires = meta["timestamp"] + meta["ttl"]
+            if time.time() >= expires:
+                return None
+            a = np.load(path + ".npy")
+        except (OSError, ValueError, KeyError):
+            return None
+        return int(expires * 1000), Bars(a[:, 0].astype(np.int64), *a[:, 1:].T)
+
+    def set(self, key, bars, ttl):
+        # Best effort: an unwritable cache only costs refetches after a restart
+        path = self.path(key)
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            # Write to temp files and rename so concurrent readers never see a partial entry
+            with open(path + ".npy.tmp", "wb") as f:
+                np.save(f, np.column_stack(bars).astype(np.float64))
+            os.replace(path + ".npy.tmp", path + ".npy")
+            with open(path + ".meta.tmp", "w") as f:
+                json.dump({"timestamp": time.time(), "ttl": ttl}, f)
+            os.replace(path + ".meta.tmp", path + ".meta")
+        except OSError as e:
+            logger.warning("Could not write klines cache %s: %s", path, e)
+
+disk_cache = FileCache(CACHE_DIR)
+
+async def fetch_ohlcv(session, symbol, interval, limit=WINDOW, retries=3, quiet=False):
+    # st.cache_data replays a cached function's st.* output on every hit, so
+    # callers running under it pass quiet=True and the messages are logged
+    write, warn, error = (logger.info, logger.warning, logger.error) if quiet else (st.write, st.warning, st.error)
+    cache = st.session_state.setdefault("klines_cache", {})
+    key = (symbol, interval, limit)
+    hit = cache.get(key)
+    if hit is not None and time.time() * 1000 < hit[0]:
+        return hit[1]
+    hit = disk_cache.get(key)
+    if hit is not None:
+        cache[key] = hit
+        return hit[1]
+
+    url = f"{SPOT_BASE}/klines"
+    params = {"symbol": symbol, "interval": interval, "limit": limit}
     for attempt in range(retries):
         try:
-            st.write(f"Fetching data for {symbol} (Attempt {attempt + 1})")
-            res = requests.get(url, timeout=10, proxies=PROXIES)
-            res.raise_for_status()
-            data = res.json()
+            write(f"Fetching data for {symbol} (Attempt {attempt + 1})")
+            await weight_budget().take(KLINES_WEIGHT)
+            async with session.get(url, params=params, proxy=PROXIES.get("https")) as res:
+                if "X-MBX-USED-WEIGHT-1M" in res.headers:
+                    weight_budget().sync(int(res.headers["X-MBX-USED-WEIGHT-1M"]), BINANCE_WEIGHT_LIMIT)
+                if res.status in (418, 429):
+                    wait = int(res.headers.get("Retry-After", 1))
+                    if wait > MAX_BACKOFF:
+                        error(f"HTTP {res.status}: Binance rate-limit ban for {wait}s. Try again later.")
+                        return None
+                    warn(f"Rate limited on {symbol}. Backing off {wait}s...")
+                    await asyncio.sleep(wait)
+                    continue
+                res.raise_for_status()
+                data = json_loads(await res.read())
             if not data:
-                st.warning(f"No data returned for {symbol}")
-                return pd.DataFrame()
-            df = pd.DataFrame(data, columns=["ts", "o", "h", "l", "c", "v", "x1", "x2", "x3", "x4", "x5", "x6"])
-            df = df.astype({"o": float, "h": float, "l": float, "c": float, "v": float})
-            df["ts"] = pd.to_datetime(df["ts"], unit="ms")
-            return df
-        except requests.exceptions.HTTPError as e:
-            if res.status_code == 451:
-                st.error(f"HTTP 451: Binance API unavailable for {symbol}. Check proxy or regional restrictions.")
+                warn(f"No data returned for {symbol}")
+                return None
+            # Only open time + OHLCV are used; drop the other 6 fields before parsing
+            a = np.asarray([row[:6] for row in data], dtype=np.float64)
+            bars = Bars(a[:, 0].astype(np.int64), *a[:, 1:].T)
+            break
+        except aiohttp.ClientResponseError as e:
+            if e.status == 451:
+                error(f"HTTP 451: Binance API unavailable for {symbol}. Check proxy or regional restrictions.")
             else:
-                st.warning(f"Error fetching {symbol}: {e}. Retrying...")
-            time.sleep(2)
+                warn(f"Error fetching {symbol}: {e}. Retrying...")
+            await asyncio.sleep(2)
         except Exception as e:
-            st.warning(f"Error fetching {symbol}: {e}. Retrying...")
-            time.sleep(2)
-    st.error(f"Failed to fetch data for {symbol} after {retries} attempts")
-    return pd.DataFrame()
+            warn(f"Error fetching {symbol}: {e}. Retrying...")
+            await asyncio.sleep(2)
+    else:
+        error(f"Failed to fetch data for {symbol} after {retries} attempts")
+        return None
+
+    expiry_ms = cache_expiry(interval)
+    cache[key] = (expiry_ms, bars)
+    disk_cache.set(key, bars, expiry_ms / 1000 - time.time())
+    return bars
 
 # Alternative CoinGecko API (uncomment to use if Binance fails)
-# def fetch_ohlcv(symbol, interval, limit=ATR_LEN + 2):
+# async def fetch_ohlcv(session, symbol, interval, limit=WINDOW):
 #     coin = symbol.replace("USDT", "").lower()  # e.g., "BTCUSDT" -> "bitcoin"
 #     url = f"https://api.coingecko.com/api/v3/coins/{coin}/ohlc?vs_currency=usd&days=7"
 #     try:
 #         st.write(f"Fetching data for {symbol} from CoinGecko")
-#         res = requests.get(url, timeout=10)
-#         res.raise_for_status()
-#         data = res.json()
-#         df = pd.DataFrame(data, columns=["ts", "o", "h", "l", "c"])
-#         df["v"] = 0.0  # CoinGecko doesn't provide volume
-#         df["ts"] = pd.to_datetime(df["ts"], unit="ms")
-#         return df
+#         async with session.get(url) as res:
+#             res.raise_for_status()
+#             data = await res.json()
+#         a = np.asarray(data, dtype=np.float64)
+#         v = np.zeros(len(a))  # CoinGecko doesn't provide volume
+#         return Bars(a[:, 0].astype(np.int64), *a[:, 1:5].T, v)
 #     except Exception as e:
 #         st.error(f"Error fetching {symbol} from CoinGecko: {e}")
-#         return pd.DataFrame()
-
-def fetch_btc_trend():
-    df = fetch_ohlcv("BTCUSDT", BTC_TF, 22)
-    if df.empty or len(df) < 22:
-        st.warning("No or insufficient data for BTCUSDT.")
-        return 0.0, 0.0, False
-    close = df.c.iat[-1]
-    ema = df.c.ewm(span=21).mean().iat[-1]
+#         return None
+
+async def fetch_btc_trend(session):
+    bars = await fetch_ohlcv(session, "BTCUSDT", BTC_TF, 22, quiet=True)
+    if bars is None or len(bars.c) < 22:
+        # Raised rather than returned so load_btc_trend does not cache the failure
+        raise ValueError("No or insufficient data for BTCUSDT.")
+    close = bars.c[-1]
+    ema = last_ema(bars.c, 21)
     return close, ema, close < ema
 
+@njit(cache=True)
+def wilder_last(x, n):
+    # Last value of Wilder's RMA (alpha = 1/n) seeded with the SMA of the first n
+    # samples. The recurrence is linear, so the tail collapses to one weighted sum.
+    k = len(x) - n
+    decay = 1.0 - 1.0 / n
+    weights = decay ** np.arange(k - 1, -1, -1)
+    return x[:n].mean() * decay ** k + (weights * x[n:]).sum() / n
+
+@njit(cache=True)
+def last_ema(x, span):
+    # Final value of pandas' default ewm(span=span).mean() (adjust=True): a
+    # normalised weighted sum, without materialising the whole series.
+    decay = 1.0 - 2.0 / (span + 1)
+    weights = decay ** np.arange(len(x) - 1, -1, -1)
+    return (weights * x).sum() / weights.sum()
+
+@njit(cache=True)
+def last_atr(h, l, c, n):
+    prev_c = c[:-1]
+    tr = np.maximum(h[1:] - l[1:], np.maximum(np.abs(h[1:] - prev_c), np.abs(l[1:] - prev_c)))
+    return wilder_last(tr, n)
+
+@njit(cache=True)
+def last_rsi(c, n):
+    delta = np.diff(c)
+    avg_up = wilder_last(np.maximum(delta, 0.0), n)
+    avg_down = wilder_last(np.maximum(-delta, 0.0), n)
+    if avg_down == 0:
+        return 100.0
+    return 100 - 100 / (1 + avg_up / avg_down)
+
+@njit(cache=True)
+def atr_kernel(arr, n):
+    # arr is (n_syms, 4, WINDOW) holding h, l, c, v rows per symbol. Serial on
+    # purpose: ~150 short windows gain nothing from prange, and parallel
+    # kernels are not safe to call from concurrent Streamlit script threads.
+    out = np.empty(arr.shape[0])
+    for i in range(arr.shape[0]):
+        out[i] = last_atr(arr[i, 0], arr[i, 1], arr[i, 2], n)
+    return out
+
+@njit(cache=True)
+def rsi_kernel(arr, n):
+    out = np.empty(arr.shape[0])
+    for i in range(arr.shape[0]):
+        out[i] = last_rsi(arr[i, 2], n)
+    return out
+
+# Without numba the kernels above run as plain Python loops, so prefer
+# TA-Lib's C implementations when they are installed. TA-Lib is optional and
+# not in requirements.txt (it needs the native library). Both seed Wilder's
+# smoothing with an SMA, so the values match either way.
+def batch_atr(arr):
+    if HAS_TALIB and not HAS_NUMBA:
+        return np.array([talib.ATR(h, l, c, timeperiod=ATR_LEN)[-1] for h, l, c, _ in arr])
+    return atr_kernel(arr, ATR_LEN)
+
+def batch_rsi(arr):
+    if HAS_TALIB and not HAS_NUMBA:
+        return np.array([talib.RSI(c, timeperiod=RSI_LEN)[-1] for _, _, c, _ in arr])
+    return rsi_kernel(arr, RSI_LEN)
+
+def scan(arr, btc_below, base=None, vavg=None):
+    # Window reductions run across all symbols at once along the bar axis,
+    # unless the caller already tracks them (KlineFeed keeps running sums)
+    close, vol = arr[:, 2], arr[:, 3]
+    if base is None:
+        base = close[:, -ATR_LEN:].mean(axis=1)
+    if vavg is None:
+        vavg = vol[:, -ATR_LEN:].mean(axis=1)
+
+    # close < base - BODY_FCTR * ATR implies close < base (ATR >= 0), and the
+    # volume spike needs no ATR at all, so ATR only runs for pairs passing both.
+    weak = (close[:, -1] < base) & (vol[:, -1] > vavg * VOL_MULT)
+    if weak.any():
+        atr = batch_atr(np.ascontiguousarray(arr[weak]))
+        weak[weak] = close[weak, -1] < base[weak] - BODY_FCTR * atr
+
+    # RSI is shown for every reported pair, so it is needed for all of them
+    rsi = batch_rsi(arr)
+    conds = np.column_stack([np.full(len(arr), btc_below), weak, rsi < RSI_OVERSOLD])
+    return conds.sum(axis=1), conds, rsi
+
+async def fetch_guarded(session, sem, symbol, interval):
+    async with sem:
+        return await fetch_ohlcv(session, symbol, interval)
+
+async def fetch_pairs(session, syms, progress_bar=None):
+    sem = asyncio.Semaphore(MAX_CONCURRENCY)
+    results = [None] * len(syms)
+
+    async def fetch_into(i, symbol):
+        results[i] = await fetch_guarded(session, sem, symbol, PAIR_TF)
+
+    # Fetches finish out of order; results keeps them aligned with syms
+    tasks = [fetch_into(i, s) for i, s in enumerate(syms)]
+    for done, task in enumerate(asyncio.as_completed(tasks), 1):
+        await task
+        if progress_bar is not None:
+            progress_bar.progress(done / len(syms))
+    return results
+
+@st.cache_data(max_entries=2)
+def load_btc_trend(expiry_ms):
+    # Keyed by cache_expiry(BTC_TF): shared by every session and rerun within
+    # one refresh, recomputed as soon as the forming 4h candle may have moved
+    return run_http(fetch_btc_trend)
+
+def usdt_rate(symbol, prices):
+    # USDT value of one unit of the pair's quote asset, taken from the shortest
+    # suffix that trades against USDT (ETHBTC -> BTCUSDT, BTCTRY -> USDTTRY);
+    # None when the quote asset cannot be valued
+    if symbol.endswith("USDT"):
+        return 1.0
+    for k in range(len(symbol) - 3, 0, -1):
+        quote = symbol[k:]
+        if prices.get(quote + "USDT"):
+            return prices[quote + "USDT"]
+        if prices.get("USDT" + quote):
+            return 1 / prices["USDT" + quote]
+    return None
+
+async def fetch_quote_volumes(session):
+    # A single /ticker/24hr call covers every symbol on the exchange. quoteVolume
+    # is in each pair's own quote asset, so it is valued in USDT to compare pairs.
+    await weight_budget().take(TICKER_24HR_WEIGHT)
+    async with session.get(f"{SPOT_BASE}/ticker/24hr", proxy=PROXIES.get("https")) as res:
+        res.raise_for_status()
+        tickers = json_loads(await res.read())
+    prices = {t["symbol"]: float(t["lastPrice"]) for t in tickers}
+    volumes = {}
+    for t in tickers:
+        if prices[t["symbol"]] > 0:
+            rate = usdt_rate(t["symbol"], prices)
+            volumes[t["symbol"]] = None if rate is None else float(t["quoteVolume"]) * rate
+    return volumes
+
+@st.cache_data(ttl=REFRESH_MIN * 60)
+def load_quote_volumes():
+    return run_http(fetch_quote_volumes)
+
+def liquid_symbols(syms):
+    try:
+        volumes = load_quote_volumes()
+    except Exception as e:
+        st.warning(f"Could not load 24h tickers, screening all symbols: {e}")
+        return syms
+    # Pairs whose quote asset has no USDT price (volume None) pass through
+    # unfiltered and unranked; pairs missing from the tickers are not trading
+    liquid = [s for s in syms if s in volumes and (volumes[s] is None or volumes[s] >= MIN_QUOTE_VOLUME)]
+    if len(liquid) < len(syms):
+        st.write(f"Skipping {len(syms) - len(liquid)} symbols below {MIN_QUOTE_VOLUME:,.0f} USDT 24h quote volume")
+    ranked = [s for s in liquid if volumes[s] is not None]
+    if TOP_N_BY_VOLUME and len(ranked) > TOP_N_BY_VOLUME:
+        # Keep the universe's order so results stay stable as volumes shift
+        top = set(sorted(ranked, key=volumes.get, reverse=True)[:TOP_N_BY_VOLUME])
+        st.write(f"Screening the top {TOP_N_BY_VOLUME} of {len(ranked)} liquid symbols by USDT 24h quote volume")
+        liquid = [s for s in liquid if s in top or volumes[s] is None]
+    return liquid
+
+class KlineFeed:
+    """Rolling PAIR_TF windows per symbol, kept current by Binance kline streams.
+
+    Windows are seeded from REST once, then every kline event (forming or
+    closed) is merged in from a background thread, so screening reads memory
+    instead of re-polling /klines for every pair.
+
+    All windows live in one (n_syms, WINDOW, 6) array of ts, o, h, l, c, v
+    rows, oldest bar first and right-aligned while a window is filling, so
+    screening slices every pair at once instead of stacking per-symbol data.
+    Close and volume sums over the last ATR_LEN bars are updated as bars
+    arrive, so the scan's base and volume averages cost nothing per rerun.
+    """
+
+    def __init__(self, syms):
+        self.rows = {s: i for i, s in enumerate(syms)}
+        self.data = np.zeros((len(syms), WINDOW, len(Bars._fields)))
+        self.count = np.zeros(len(syms), dtype=np.int64)
+        self.sums = np.zeros((len(syms), 2))  # close, volume over the last ATR_LEN bars
+        self.seeded = set()
+        self.lock = threading.Lock()
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        for i in range(0, len(syms), MAX_STREAMS):
+            asyncio.run_coroutine_threadsafe(self.stream(syms[i:i + MAX_STREAMS]), loop)
+
+    def merge(self, i, row):
+        # Kline events repeat the open time while a candle is forming: overwrite
+        # the last bar in that case, shift in a new one once a candle opens.
+        # Callers hold the lock.
+        window = self.data[i]
+        if self.count[i] and row[0] == window[-1, 0]:
+            self.sums[i] += (row[4] - window[-1, 4], row[5] - window[-1, 5])
+            window[-1] = row
+        elif not self.count[i] or row[0] > window[-1, 0]:
+            # The bar leaving the ATR_LEN span; zeros while the window fills
+            old = window[WINDOW - ATR_LEN]
+            self.sums[i] += (row[4] - old[4], row[5] - old[5])
+            window[:-1] = window[1:]
+            window[-1] = row
+            self.count[i] = min(self.count[i] + 1, WINDOW)
+
+    def ready(self, symbol):
+        with self.lock:
+            return symbol in self.seeded and self.count[self.rows[symbol]] == WINDOW
+
+    def seed(self, symbol, bars):
+        i = self.rows[symbol]
+        history = np.column_stack(bars)[-WINDOW:]
+        with self.lock:
+            window = self.data[i]
+            # Events that arrived while REST was in flight are newer; replay them
+            live = window[WINDOW - self.count[i]:]
+            live = live[live[:, 0] >= bars.ts[-1]].copy()
+            window[:WINDOW - len(history)] = 0
+            window[WINDOW - len(history):] = history
+            self.count[i] = len(history)
+            # Recomputed on every (re)seed so float drift never accumulates
+            self.sums[i] = window[-ATR_LEN:, 4:].sum(axis=0)
+            for row in live:
+                self.merge(i, row)
+            self.seeded.add(symbol)
+
+    def snapshot(self, syms):
+        # (n_syms, 4, WINDOW) h, l, c, v block in the layout scan() expects,
+        # plus the matching base and vavg, taken under one lock
+        idx = [self.rows[s] for s in syms]
+        with self.lock:
+            block = self.data[idx, :, 2:]
+            means = self.sums[idx] / ATR_LEN
+        return np.ascontiguousarray(block.transpose(0, 2, 1)), means[:, 0], means[:, 1]
+
+    async def stream(self, syms):
+        params = [f"{s.lower()}@kline_{PAIR_TF}" for s in syms]
+        delay = 5
+        async with aiohttp.ClientSession() as session:
+            while True:
+                try:
+                    async with session.ws_connect(f"{WS_BASE}/stream", proxy=PROXIES.get("https"), heartbeat=60) as ws:
+                        # Binance caps incoming messages at 5/s, so subscribe in batches
+                        for i in range(0, len(params), 200):
+                            await ws.send_json({"method": "SUBSCRIBE", "params": params[i:i + 200], "id": i})
+                            await asyncio.sleep(0.25)
+                        # A rerun may have seeded these while the stream was down;
+                        # events from then until now are lost, so seed them again
+                        with self.lock:
+                            self.seeded.difference_update(syms)
+                        async for msg in ws:
+                            if msg.type == aiohttp.WSMsgType.ERROR:
+                                logger.warning("Kline stream error: %s", ws.exception())
+                            if msg.type != aiohttp.WSMsgType.TEXT:
+                                break
+                            payload = json_loads(msg.data)
+                            if "error" in payload:
+                                logger.warning("Kline stream request %s rejected: %s", payload.get("id"), payload["error"])
+                                continue
+                            data = payload.get("data")
+                            if data is None:
+                                continue  # Subscription ack
+                            k = data["k"]
+                            row = (k["t"], float(k["o"]), float(k["h"]), float(k["l"]), float(k["c"]), float(k["v"]))
+                            with self.lock:
+                                self.merge(self.rows[data["s"]], row)
+                            delay = 5  # Events are flowing again
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.warning("Kline stream disconnected: %s", e)
+                except Exception:
+                    logger.exception("Kline stream failed")
+                # Events were missed while disconnected; reseed these from REST
+                with self.lock:
+                    self.seeded.difference_update(syms)
+                logger.info("Reconnecting kline stream in %ss", delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+@st.cache_resource
+def get_feed(syms):
+    return KlineFeed(list(syms))
+
 def run_screening():
-    syms = load_symbols()
-    rows = []
-    btc_close, btc_ema21, btcBelow = fetch_btc_trend()
+    universe = load_symbols()
+    syms = liquid_symbols(universe) if universe else []
+    # The stream follows the whole universe so a pair crossing the volume
+    # threshold does not restart it
+    feed = get_feed(tuple(universe)) if KLINE_STREAM and syms else None
+    stale = [s for s in syms if feed is None or not feed.ready(s)]
+    try:
+        btc_close, btc_ema21, btcBelow = load_btc_trend(cache_expiry(BTC_TF))
+    except Exception as e:
+        st.warning(f"Could not load the BTC trend, BTC < EMA-21 counts as not met: {e}")
+        btc_close, btc_ema21, btcBelow = 0.0, 0.0, False
+    progress_bar = st.progress(0) if stale else None
+    fetched = run_http(fetch_pairs, stale, progress_bar)
+    if feed is not None:
+        for s, bars in zip(stale, fetched):
+            if bars is not None:
+                feed.seed(s, bars)
 
     if not syms:
         st.warning("No symbols to screen.")
         return pd.DataFrame(), btc_close, btc_ema21
 
     st.write(f"Screening {len(syms)} symbols...")
-    progress_bar = st.progress(0)
-    total_syms = len(syms)
-
-    for i, s in enumerate(syms):
-        try:
-            df = fetch_ohlcv(s, PAIR_TF)
-            time.sleep(0.5)  # Delay to avoid rate limits
-            if df.empty or len(df) < ATR_LEN:
-                st.write(f"Skipping {s} (no data or insufficient data)")
-                continue
-
-            close = df.c.iat[-1]
-            vol = df.v.iat[-1]
-            base = df.c.tail(ATR_LEN).mean()
-            atr = AverageTrueRange(df.h, df.l, df.c, ATR_LEN).average_true_range().iat[-1]
-            vavg = df.v.tail(ATR_LEN).mean()
-
-            # Validate calculations
-            if any(pd.isna(x) for x in [base, atr, vavg]):
-                st.write(f"Skipping {s} (invalid base, atr, or vavg)")
-                continue
-
-            # RSI calculation with validation
-            gain = df.c.pct_change().fillna(0)
-            if len(gain) < 14:
-                st.write(f"Skipping {s} (insufficient data for RSI)")
-                continue
-
-            delta = gain.rolling(14).mean()
-            loss = (-gain).rolling(14).mean()
-
-            # Avoid division by zero
-            rs = delta / loss
-            rs = rs.replace([np.inf, -np.inf], np.nan).fillna(0)
-            rsi = 100 - (100 / (1 + rs))
-            rsi_val = rsi.iat[-1] if not rsi.empty else 50
-
-            cond1 = btcBelow
-            cond2 = close < base - BODY_FCTR * atr and vol > vavg * VOL_MULT
-            cond3 = rsi_val < 30
-
-            conditions = [cond1, cond2, cond3]
-            score = sum(conditions)
-
-            if score >= 1:
-                state = {3: "🚨 FULL PRE-DIP", 2: "⚠️ NEAR-DIP", 1: "🔥 WARM-DIP"}[score]
-                rows.append({
-                    "Symbol": s,
-                    "Score": score,
-                    "BTC<EMA21": cond1,
-                    "Weak+Vol": cond2,
-                    "RSI<30": cond3,
-                    "RSI": rsi_val,
-                    "State": state
-                })
+    if feed is not None:
+        names = [s for s in syms if feed.ready(s)]
+        arr, base, vavg = feed.snapshot(names) if names else (None, None, None)
+    else:
+        names, windows = [], []
+        for s, bars in zip(syms, fetched):
+            if bars is not None and len(bars.c) >= WINDOW:
+                names.append(s)
+                windows.append(np.array([bars.h, bars.l, bars.c, bars.v])[:, -WINDOW:])
+        arr = np.ascontiguousarray(np.stack(windows)) if windows else None
+        base = vavg = None
+    screened = set(names)
+    for s in syms:
+        if s not in screened:
+            st.write(f"Skipping {s} (no data or insufficient data)")
 
-        except Exception as e:
-            st.error(f"Error processing {s}: {e}")
-            continue
+    df_all = pd.DataFrame()
+    if arr is not None:
+        scores, conds, rsis = scan(arr, btcBelow, base, vavg)
 
-        progress_bar.progress((i + 1) / total_syms)
+        # Highest score first; stable so pairs keep their input order within a level
+        order = np.argsort(-scores, kind="stable")
+        hits = order[scores[order] >= 1]
+        if len(hits):
+            df_all = pd.DataFrame({
+                "Symbol": np.array(names)[hits],
+                "Score": scores[hits],
+                "BTC<EMA21": conds[hits, 0],
+                "Weak+Vol": conds[hits, 1],
+                "RSI<30": conds[hits, 2],
+                "RSI": rsis[hits],
+                "State": STATE_LABELS[scores[hits]]
+            })
 
-    df_all = pd.DataFrame(rows)
-    if not df_all.empty and "Score" in df_all.columns:
-        df_all = df_all.sort_values("Score", ascending=False)
-    else:
+    if df_all.empty:
         st.warning("No valid data processed. Check API availability, proxy settings, or symbol list.")
     return df_all, btc_close, btc_ema21
 
@@ -209,10 +686,10 @@ else:
     - RSI < 30 (Oversold)
     """)
 
-    for level, label in zip([3, 2, 1], ["🚨 FULL PRE-DIP", "⚠️ NEAR-DIP", "🔥 WARM-DIP"]):
-        subset = df[df["Score"] == level]
-        if not subset.empty:
-            st.subheader(label)
-            st.dataframe(subset.set_index("Symbol"))
+    groups = dict(list(df.groupby("Score", sort=False)))
+    for level in (3, 2, 1):
+        if level in groups:
+            st.subheader(STATE_LABELS[level])
+            st.dataframe(groups[level].set_index("Symbol"))
 
 st.write(f"🕒 Last refreshed: {time.strftime('%Y-%m-%d %H:%M:%S')}")
\ No newline at end of file